@@ -1,6 +1,11 @@
 from flask import Flask, render_template, request, jsonify
+import fnmatch
+import heapq
+import itertools
+import math
 import threading
-from simulation import simulation_loop
+import time
+from simulation import simulation_loop, FULL_REFRESH
 
 app = Flask(__name__)
 
@@ -16,6 +21,121 @@ active_event = {
     "SUBSTATION": {},
     "WATERLINE": {}
 }
+state_lock = threading.Lock()  # Protege active_event y pending_refresh_targets
+pending_refresh_targets = set()  # Objetivos a refrescar en el próximo refresco inmediato
+
+class FaultExpiryScheduler:
+    """
+    Desactiva eventos con duración al cumplirse su plazo.
+
+    Los vencimientos se guardan en un heap ordenado por plazo y un único hilo
+    duerme hasta el más próximo, despertando solo cuando se agenda uno anterior.
+    Los vencidos en una misma pasada se entregan juntos a on_expire.
+    schedule/cancel/clear deben llamarse con state_lock tomado.
+    """
+
+    def __init__(self, on_expire):
+        self._on_expire = on_expire
+        self._condition = threading.Condition()
+        self._heap = []  # (deadline, seq, target, event_type)
+        self._current = {}  # (target, event_type) -> seq vigente en el heap
+        self._due = {}  # (target, event_type) -> seq vencido pendiente de consumir
+        self._counter = itertools.count()
+        self._thread = None
+
+    def schedule(self, target, event_type, deadline):
+        """Agenda el vencimiento en deadline (segundos de time.monotonic())."""
+        with self._condition:
+            key = (target, event_type)
+            seq = next(self._counter)
+            self._due.pop(key, None)
+            self._current[key] = seq
+            heapq.heappush(self._heap, (deadline, seq, target, event_type))
+            self._discard_stale()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+            elif self._heap[0][1] == seq:
+                self._condition.notify()  # El nuevo vencimiento es el más próximo
+
+    def cancel(self, target, event_type):
+        with self._condition:
+            self._current.pop((target, event_type), None)
+            self._due.pop((target, event_type), None)
+            self._discard_stale()
+
+    def clear(self):
+        with self._condition:
+            self._current.clear()
+            self._due.clear()
+            self._heap.clear()
+
+    def consume(self, target, event_type, seq):
+        """Devuelve True si seq sigue siendo el vencimiento vigente y lo retira."""
+        with self._condition:
+            if self._due.get((target, event_type)) != seq:
+                return False
+            del self._due[(target, event_type)]
+            return True
+
+    def _discard_stale(self):
+        # Cada clave vigente tiene una sola entrada en el heap; el resto son obsoletas.
+        # Se reconstruye cuando las obsoletas superan a las vigentes (coste amortizado O(1)).
+        if len(self._heap) > 2 * len(self._current):
+            self._heap = [entry for entry in self._heap
+                          if self._current.get((entry[2], entry[3])) == entry[1]]
+            heapq.heapify(self._heap)
+
+    def _run(self):
+        while True:
+            due = []
+            with self._condition:
+                while not self._heap:
+                    self._condition.wait()
+                now = time.monotonic()
+                while self._heap and self._heap[0][0] <= now:
+                    _, seq, target, event_type = heapq.heappop(self._heap)
+                    key = (target, event_type)
+                    if self._current.get(key) == seq:
+                        del self._current[key]
+                        self._due[key] = seq
+                        due.append((target, event_type, seq))
+                if not due:
+                    if self._heap:
+                        timeout = min(self._heap[0][0] - now, threading.TIMEOUT_MAX)
+                        self._condition.wait(timeout=timeout)
+                    continue
+            # Fuera del Condition para respetar el orden state_lock -> Condition
+            try:
+                self._on_expire(due)
+            except Exception as e:
+                print(f"Error al expirar eventos {due}: {e}")
+
+def request_refresh(targets=None):
+    """Solicita un refresco inmediato de los objetivos indicados (todos si es None)."""
+    with state_lock:
+        if targets is None:
+            pending_refresh_targets.add(FULL_REFRESH)
+        else:
+            pending_refresh_targets.update(targets)
+    immediate_refresh_event.set()
+
+def expire_faults(due):
+    """Desactiva juntos los eventos vencidos para que la simulación no vea un estado intermedio."""
+    expired = []
+    with state_lock:
+        for target, event_type, seq in due:
+            if fault_scheduler.consume(target, event_type, seq) and \
+                    active_event[target].pop(event_type, None) is not None:
+                expired.append((target, event_type))
+    if not expired:
+        return
+    for target, event_type in expired:
+        print(f"Evento '{event_type}' expirado para el objetivo '{target}'.")
+    request_refresh({target for target, _ in expired})
+
+fault_scheduler = FaultExpiryScheduler(expire_faults)
 
 # --- Rutas de la Interfaz ---
 @app.route('/')
@@ -33,9 +153,12 @@ def start_simulation():
     if simulation_thread is None or not simulation_thread.is_alive():
         simulation_stop_event.clear() # Limpiar el evento de detención para la nueva ejecución
         immediate_refresh_event.clear()  # Clear the immediate refresh event
+        with state_lock:
+            pending_refresh_targets.clear()
         simulation_thread = threading.Thread(
             target=simulation_loop, 
-            args=(simulation_stop_event, active_event, interval, immediate_refresh_event)
+            args=(simulation_stop_event, active_event, interval, immediate_refresh_event,
+                  pending_refresh_targets, state_lock)
         )
         simulation_thread.daemon = True
         simulation_thread.start()
@@ -61,17 +184,19 @@ def trigger_event():
     
     if not event_name or event_name == "none":
         # Turn off all events - reset to normal operation
-        active_event.update({
-            "T3": {},
-            "T4": {},
-            "BATTERY": {},
-            "SUBSTATION": {},
-            "WATERLINE": {}
-        })
+        with state_lock:
+            active_event.update({
+                "T3": {},
+                "T4": {},
+                "BATTERY": {},
+                "SUBSTATION": {},
+                "WATERLINE": {}
+            })
+            fault_scheduler.clear()
         msg = "Operación normal - todos los eventos desactivados."
         print(msg)
         # Trigger immediate refresh after clearing events
-        immediate_refresh_event.set()
+        request_refresh()
         return jsonify({"status": "Running", "message": msg})
 
     try:
@@ -79,41 +204,118 @@ def trigger_event():
         target = target.upper()
         
         # Toggle the specific event on/off
-        if active_event[target].get(event_type) == True:
-            # Turn off the event
-            del active_event[target][event_type]
-            msg = f"Evento '{event_type}' desactivado para el objetivo '{target}'."
-        else:
-            # Turn on the event
-            active_event[target][event_type] = True
-            msg = f"Evento '{event_type}' activado para el objetivo '{target}'."
+        with state_lock:
+            fault_scheduler.cancel(target, event_type)
+            if active_event[target].get(event_type) == True:
+                # Turn off the event
+                del active_event[target][event_type]
+                msg = f"Evento '{event_type}' desactivado para el objetivo '{target}'."
+            else:
+                # Turn on the event
+                active_event[target][event_type] = True
+                msg = f"Evento '{event_type}' activado para el objetivo '{target}'."
         
         print(msg)
         # Trigger immediate refresh after changing event status
-        immediate_refresh_event.set()
+        request_refresh({target})
         return jsonify({"status": "Running", "message": msg})
     except (ValueError, KeyError) as e:
         msg = f"Formato de evento inválido o clave no encontrada: {event_name}"
         print(f"{msg} - Error: {e}")
         return jsonify({"status": "Error", "message": msg}), 400
 
+@app.route('/trigger_events_batch', methods=['POST'])
+def trigger_events_batch():
+    """
+    Aplica varios eventos en una sola llamada. Cuerpo esperado:
+        {"events": [{"target": "T*", "event": "overload", "active": true, "duration": 60}, ...]}
+
+    "target" es un patrón glob sobre los objetivos (T3, T4, BATTERY, ...), "active"
+    es opcional (por defecto true) y "duration" (segundos) desactiva el evento al vencer.
+    Si alguna entrada es inválida no se aplica ninguna.
+    """
+    data = request.get_json(silent=True)
+    entries = data.get("events") if isinstance(data, dict) else None
+    if not isinstance(entries, list) or not entries:
+        msg = "Se requiere una lista no vacía en 'events'."
+        return jsonify({"status": "Error", "message": msg}), 400
+
+    # Validar todas las entradas antes de modificar el estado
+    operations = []
+    for index, entry in enumerate(entries):
+        try:
+            pattern = entry["target"]
+            event_type = entry["event"]
+            active = entry.get("active", True)
+            duration = entry.get("duration")
+            if not isinstance(pattern, str) or not isinstance(event_type, str) or not event_type:
+                raise ValueError("'target' y 'event' deben ser textos no vacíos")
+            if not isinstance(active, bool):
+                raise ValueError("'active' debe ser booleano")
+            if duration is not None:
+                if not active:
+                    raise ValueError("'duration' solo aplica al activar un evento")
+                if isinstance(duration, bool) or not isinstance(duration, (int, float)):
+                    raise ValueError("'duration' debe ser un número")
+                if not math.isfinite(duration) or not 0 < duration <= threading.TIMEOUT_MAX:
+                    raise ValueError(f"'duration' debe ser positiva y no mayor que {threading.TIMEOUT_MAX}")
+            targets = [t for t in active_event if fnmatch.fnmatchcase(t, pattern.upper())]
+            if not targets:
+                raise KeyError(pattern)
+        except (AttributeError, TypeError, ValueError, KeyError) as e:
+            msg = f"Entrada {index} inválida: {entry}"
+            print(f"{msg} - Error: {e}")
+            return jsonify({"status": "Error", "message": msg}), 400
+        operations.extend((target, event_type, active, duration) for target in targets)
+
+    with state_lock:
+        # Estado previo de cada (objetivo, evento) tocado, para comparar tras todo el lote
+        before = {(target, event_type): active_event[target].get(event_type) == True
+                  for target, event_type, _, _ in operations}
+        now = time.monotonic()  # Plazo común para que las entradas de una misma duración venzan juntas
+        for target, event_type, active, duration in operations:
+            if active:
+                active_event[target][event_type] = True
+                if duration is not None:
+                    fault_scheduler.schedule(target, event_type, now + duration)
+                else:
+                    fault_scheduler.cancel(target, event_type)
+            else:
+                active_event[target].pop(event_type, None)
+                fault_scheduler.cancel(target, event_type)
+        changed_targets = {target for (target, event_type), was_active in before.items()
+                           if (active_event[target].get(event_type) == True) != was_active}
+
+    msg = f"{len(operations)} cambios de evento aplicados; {len(changed_targets)} objetivos modificados."
+    print(msg)
+    if changed_targets:
+        # Solo se refrescan los dispositivos afectados por el lote
+        request_refresh(changed_targets)
+    return jsonify({
+        "status": "Running",
+        "message": msg,
+        "changed_targets": sorted(changed_targets)
+    })
+
 @app.route('/api/status', methods=['GET'])
 def get_status():
     global simulation_thread, active_event
     
     # El estado de la simulación se deriva directamente del estado del hilo
     simulation_running = simulation_thread is not None and simulation_thread.is_alive()
+    with state_lock:
+        active_events = {target: dict(events) for target, events in active_event.items()}
         
     return jsonify({
         "simulation_running": simulation_running,
-        "active_events": active_event
+        "active_events": active_events
     })
 
 @app.route('/trigger_immediate_refresh', methods=['POST'])
 def trigger_immediate_refresh():
     global immediate_refresh_event
     try:
-        immediate_refresh_event.set()
+        request_refresh()
         return jsonify({
             "status": "success",
             "message": "Immediate refresh triggered"
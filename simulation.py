@@ -5,6 +5,9 @@ import paho.mqtt.publish as publish
 from datetime import datetime
 import threading
 
+# Marcador en el conjunto de objetivos pendientes que solicita refrescar todos los dispositivos
+FULL_REFRESH = "*"
+
 # --- Variables de estado para datos con tendencia natural ---
 trend_values = {}
 last_update_times = {}
@@ -61,6 +64,24 @@ def check_event_active(active_events, target, event_type):
     """Check if a specific event is active for a specific target"""
     return active_events.get(target, {}).get(event_type) == True
 
+def select_refresh_devices(mqtt_devices, refresh_targets, state_lock):
+    """
+    Consume los objetivos pendientes de refresco inmediato y devuelve los dispositivos a publicar.
+
+    Sin seguimiento de objetivos (refresh_targets None) o con FULL_REFRESH en el
+    conjunto se refrescan todos los dispositivos; un conjunto vacío no publica nada.
+    """
+    if refresh_targets is None:
+        return mqtt_devices
+
+    with state_lock:
+        targets = set(refresh_targets)
+        refresh_targets.clear()
+
+    if FULL_REFRESH in targets:
+        return mqtt_devices
+    return [device for device in mqtt_devices if device["target"] in targets]
+
 # --- Clases de Componentes de Simulación ---
 
 class Transformer:
@@ -442,9 +463,14 @@ class Substation:
         }
 
 # --- Bucle Principal de Simulación ---
-def simulation_loop(stop_event, active_event_ref, interval_seconds, immediate_refresh_event=None):
+def simulation_loop(stop_event, active_event_ref, interval_seconds, immediate_refresh_event=None,
+                    refresh_targets=None, state_lock=None):
     print("Bucle de simulación iniciado.")
 
+    # Lock compartido con la API para leer active_event_ref de forma consistente
+    if state_lock is None:
+        state_lock = threading.Lock()
+
     t3 = Transformer("T3")
     t4 = Transformer("T4")
     charger = BatteryCharger()
@@ -454,39 +480,47 @@ def simulation_loop(stop_event, active_event_ref, interval_seconds, immediate_re
     mqtt_devices = [
         {
             "name": "T3",
+            "target": "T3",
             "token": "",
             "data_func": t3.update_data
         },
         {
             "name": "T4",
+            "target": "T4",
             "token": "",
             "data_func": t4.update_data
         },
         {
             "name": "Baterías",
+            "target": "BATTERY",
             "token": "",
             "data_func": charger.update_data
         },
         {
             "name": "General",
+            "target": "SUBSTATION",
             "token": "",
             "data_func": station.update_data
         }
     ]
 
+    devices_to_publish = mqtt_devices
     while not stop_event.is_set():
+        full_publish = len(devices_to_publish) == len(mqtt_devices)
         # Send data normally at the beginning of the cycle or when immediate refresh is triggered
         try:
-            for device in mqtt_devices:
-                payload = device["data_func"](active_event_ref)
-                
+            # Generate every payload from the same snapshot of active events
+            with state_lock:
+                payloads = [(device, device["data_func"](active_event_ref)) for device in devices_to_publish]
+
+            for device, payload in payloads:
                 # Extraer el estado y publicarlo como atributo
                 status_payload = {"status": payload.pop("status", 0)} # Extraer con valor por defecto
                 publish.single(
-                    topic="",
+                    topic="v1/devices/me/attributes",
                     payload=json.dumps(status_payload),
-                    hostname="",
-                    port=,
+                    hostname="iot.sstech.cl",
+                    port=11883,
                     auth={'username': device["token"], 'password': ''}
                 )
 
@@ -505,21 +539,32 @@ def simulation_loop(stop_event, active_event_ref, interval_seconds, immediate_re
         except Exception as e:
             print(f"Error en el bucle de simulación: {e}")
 
+        # Only a full-fleet publish restarts the periodic deadline, so targeted refreshes
+        # never delay the devices they did not publish
+        if full_publish:
+            next_full_publish = time.monotonic() + interval_seconds
+
         # Wait for the interval but allow immediate refresh by checking the event periodically
-        remaining_time = interval_seconds
-        while remaining_time > 0 and not stop_event.is_set():
+        devices_to_publish = mqtt_devices
+        while not stop_event.is_set():
+            remaining_time = next_full_publish - time.monotonic()
+            if remaining_time <= 0:
+                break
+
             # Check if there's an immediate refresh request
             if immediate_refresh_event and immediate_refresh_event.is_set():
                 immediate_refresh_event.clear()  # Clear the event
-                print("Immediate refresh requested, sending data now...")
-                break  # Break the wait to send data immediately
-
-            # Wait for 1 second or until the immediate refresh event is set
+                refresh_devices = select_refresh_devices(mqtt_devices, refresh_targets, state_lock)
+                if refresh_devices:
+                    devices_to_publish = refresh_devices
+                    print(f"Immediate refresh requested for {[device['name'] for device in refresh_devices]}, sending data now...")
+                    break  # Break the wait to send data immediately
+                continue  # The change does not affect any published device, keep waiting
+
+            # Wait for up to 1 second or until the immediate refresh event is set
             if immediate_refresh_event:
-                immediate_refresh_event.wait(timeout=1)
+                immediate_refresh_event.wait(timeout=min(1, remaining_time))
             else:
-                time.sleep(1)
-            
-            remaining_time -= 1
+                time.sleep(min(1, remaining_time))
 
     print("Bucle de simulación detenido.")
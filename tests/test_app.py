@@ -0,0 +1,160 @@
+import time
+
+import pytest
+
+import app
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return predicate()
+
+
+@pytest.fixture
+def client():
+    with app.state_lock:
+        for events in app.active_event.values():
+            events.clear()
+        app.fault_scheduler.clear()
+        app.pending_refresh_targets.clear()
+    app.immediate_refresh_event.clear()
+    return app.app.test_client()
+
+
+def post_batch(client, events):
+    return client.post('/trigger_events_batch', json={"events": events})
+
+
+def test_batch_glob_matches_targets_and_refreshes_only_changed(client):
+    response = post_batch(client, [{"target": "t*", "event": "overload"}])
+
+    assert response.status_code == 200
+    assert response.get_json()["changed_targets"] == ["T3", "T4"]
+    assert app.active_event["T3"] == {"overload": True}
+    assert app.active_event["T4"] == {"overload": True}
+    assert app.pending_refresh_targets == {"T3", "T4"}
+    assert app.immediate_refresh_event.is_set()
+
+
+def test_batch_that_cancels_itself_does_not_refresh(client):
+    response = post_batch(client, [
+        {"target": "T*", "event": "overload"},
+        {"target": "T3", "event": "overload", "active": False},
+    ])
+
+    assert response.get_json()["changed_targets"] == ["T4"]
+    assert app.active_event["T3"] == {}
+    assert app.pending_refresh_targets == {"T4"}
+
+
+def test_batch_without_changes_does_not_refresh(client):
+    post_batch(client, [{"target": "BATTERY", "event": "fault", "active": False}])
+
+    assert app.pending_refresh_targets == set()
+    assert not app.immediate_refresh_event.is_set()
+
+
+def test_invalid_entry_leaves_state_unchanged(client):
+    response = post_batch(client, [
+        {"target": "T3", "event": "overload"},
+        {"target": "X*", "event": "overload"},
+    ])
+
+    assert response.status_code == 400
+    assert all(events == {} for events in app.active_event.values())
+    assert app.pending_refresh_targets == set()
+
+
+@pytest.mark.parametrize("body", ['[{"target": "T3", "event": "overload"}]', '"x"', 'null'])
+def test_non_object_body_is_rejected(client, body):
+    response = client.post('/trigger_events_batch', data=body, content_type='application/json')
+
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("duration", ["1e10", "NaN", "Infinity", "0", "-1", "true"])
+def test_invalid_duration_is_rejected(client, duration):
+    body = '{"events": [{"target": "T3", "event": "overload", "duration": %s}]}' % duration
+    response = client.post('/trigger_events_batch', data=body, content_type='application/json')
+
+    assert response.status_code == 400
+    assert app.active_event["T3"] == {}
+
+
+def test_expiry_fires_and_refreshes_target(client):
+    post_batch(client, [{"target": "T3", "event": "overload", "duration": 0.2}])
+    with app.state_lock:
+        app.pending_refresh_targets.clear()
+
+    assert wait_until(lambda: app.active_event["T3"] == {})
+    assert app.pending_refresh_targets == {"T3"}
+
+
+def test_trigger_event_cancels_pending_expiry(client):
+    post_batch(client, [{"target": "T3", "event": "overload", "duration": 0.2}])
+    client.post('/trigger_event', json={"event": "T3_overload"})  # Off
+    client.post('/trigger_event', json={"event": "T3_overload"})  # On, sin duración
+
+    time.sleep(0.5)
+    assert app.active_event["T3"] == {"overload": True}
+
+
+def test_rescheduled_duration_replaces_previous(client):
+    post_batch(client, [{"target": "T3", "event": "overload", "duration": 0.2}])
+    post_batch(client, [{"target": "T3", "event": "overload", "duration": 30}])
+    post_batch(client, [{"target": "T4", "event": "overload", "duration": 30}])
+    post_batch(client, [{"target": "T4", "event": "overload", "duration": 0.2}])
+
+    assert wait_until(lambda: app.active_event["T4"] == {})
+    time.sleep(0.2)
+    assert app.active_event["T3"] == {"overload": True}
+
+
+def test_expiry_still_works_after_large_duration(client):
+    post_batch(client, [{"target": "T4", "event": "overload", "duration": 1e6}])
+    post_batch(client, [{"target": "T3", "event": "overload", "duration": 0.2}])
+
+    assert wait_until(lambda: app.active_event["T3"] == {})
+    assert app.active_event["T4"] == {"overload": True}
+
+
+def test_glob_entry_expires_in_a_single_callback():
+    calls = []
+    scheduler = app.FaultExpiryScheduler(calls.append)
+    deadline = time.monotonic() + 0.1
+    scheduler.schedule("T3", "overload", deadline)
+    scheduler.schedule("T4", "overload", deadline)
+
+    assert wait_until(lambda: calls)
+    assert sorted(target for target, _, _ in calls[0]) == ["T3", "T4"]
+    assert len(calls) == 1
+
+
+def test_expire_faults_refreshes_targets_once(client, monkeypatch):
+    post_batch(client, [{"target": "T*", "event": "overload", "duration": 0.2}])
+    refreshes = []
+    monkeypatch.setattr(app, "request_refresh", refreshes.append)
+
+    assert wait_until(lambda: refreshes)
+    assert refreshes == [{"T3", "T4"}]
+    assert app.active_event["T3"] == {} and app.active_event["T4"] == {}
+
+
+def test_heap_stays_bounded_under_reschedule_and_cancel():
+    scheduler = app.FaultExpiryScheduler(lambda due: None)
+    targets = list(app.active_event)
+    deadline = time.monotonic() + 1e6
+    for _ in range(2000):
+        for target in targets:
+            scheduler.schedule(target, "overload", deadline)
+        for target in targets:
+            scheduler.schedule(target, "overload", deadline)  # Reagendar sustituye al anterior
+        for target in targets:
+            scheduler.cancel(target, "overload")
+
+    assert len(scheduler._current) == 0
+    assert len(scheduler._heap) <= 2 * len(targets)
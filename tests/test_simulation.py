@@ -0,0 +1,98 @@
+import json
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+import simulation
+from simulation import FULL_REFRESH, select_refresh_devices
+
+DEVICES = [{"name": name, "target": target} for name, target in
+           [("T3", "T3"), ("T4", "T4"), ("Baterías", "BATTERY"), ("General", "SUBSTATION")]]
+
+# Clave de telemetría que identifica a cada dispositivo
+DEVICE_KEYS = {"T3": "t3_status", "T4": "t4_status", "Baterías": "charger_status", "General": "grid_frequency_Hz"}
+
+
+def test_select_refresh_devices_filters_by_target():
+    targets = {"T4", "WATERLINE"}
+
+    assert select_refresh_devices(DEVICES, targets, threading.Lock()) == [DEVICES[1]]
+    assert targets == set()
+
+
+def test_select_refresh_devices_full_refresh():
+    assert select_refresh_devices(DEVICES, {FULL_REFRESH, "T3"}, threading.Lock()) == DEVICES
+    assert select_refresh_devices(DEVICES, None, threading.Lock()) == DEVICES
+
+
+def test_select_refresh_devices_empty_set_publishes_nothing():
+    assert select_refresh_devices(DEVICES, set(), threading.Lock()) == []
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+class ScriptedRefreshEvent:
+    """Event falso: cada wait avanza el reloj un paso y ejecuta on_tick."""
+
+    def __init__(self, clock, step, on_tick):
+        self._clock = clock
+        self._step = step
+        self._on_tick = on_tick
+        self._flag = False
+
+    def is_set(self):
+        return self._flag
+
+    def set(self):
+        self._flag = True
+
+    def clear(self):
+        self._flag = False
+
+    def wait(self, timeout=None):
+        self._clock.now += min(timeout, self._step)
+        self._on_tick()
+        return self._flag
+
+
+def test_targeted_refresh_does_not_delay_periodic_publish(monkeypatch):
+    published = Counter()
+
+    def fake_single(topic, payload, **kwargs):
+        if topic == "v1/devices/me/telemetry":
+            data = json.loads(payload)
+            for name, key in DEVICE_KEYS.items():
+                if key in data:
+                    published[name] += 1
+
+    clock = FakeClock()
+    monkeypatch.setattr(simulation.publish, "single", fake_single)
+    monkeypatch.setattr(simulation, "time", SimpleNamespace(time=time.time, sleep=time.sleep, monotonic=clock.monotonic))
+
+    stop_event = threading.Event()
+    refresh_targets = set()
+    state_lock = threading.Lock()
+
+    def on_tick():
+        # Refrescar T3 cada 0.25 s durante 5 s con un intervalo periódico de 2 s
+        if clock.now >= 5:
+            stop_event.set()
+            return
+        refresh_targets.add("T3")
+        refresh_event.set()
+
+    refresh_event = ScriptedRefreshEvent(clock, 0.25, on_tick)
+    active_event = {"T3": {}, "T4": {}, "BATTERY": {}, "SUBSTATION": {}, "WATERLINE": {}}
+    simulation.simulation_loop(stop_event, active_event, 2, refresh_event, refresh_targets, state_lock)
+
+    # Publicaciones completas en t=0, 2 y 4 s pese a los refrescos de T3
+    for name in ("T4", "Baterías", "General"):
+        assert published[name] == 3
+    assert published["T3"] > 3